@@ -5,13 +5,17 @@ Scrapes listings matching your criteria and sends email alerts for new apartment
 """
 
 import os
+import html
 import json
+import math
 import sqlite3
 import smtplib
 import re
 import time
 import random
 import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from datetime import datetime, timezone
@@ -21,7 +25,7 @@ from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
+from selenium.common.exceptions import TimeoutException, SessionNotCreatedException
 
 # =============================================================================
 # CONFIGURATION - Customize your search here!
@@ -64,6 +68,12 @@ EMAIL_RECIPIENT = os.environ.get("EMAIL_RECIPIENT", "")
 def init_db():
     """Initialize SQLite database for tracking seen listings."""
     conn = sqlite3.connect(DB_PATH)
+    # WAL avoids the full rollback-journal fsync on every commit and lets
+    # reads run alongside writes
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-20000")
     cursor = conn.cursor()
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS listings (
@@ -83,7 +93,7 @@ def init_db():
             is_no_fee INTEGER DEFAULT 0,
             building_name TEXT,
             raw_data TEXT
-        )
+        ) WITHOUT ROWID
     """)
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS alerts (
@@ -98,6 +108,67 @@ def init_db():
     return conn
 
 
+# Resolved once per process; the lock keeps parallel scrape workers from
+# racing ChromeDriverManager's shared download directory on a cold cache
+_chromedriver_path = None
+_chromedriver_lock = threading.Lock()
+_CHROMEDRIVER_CACHE_FILE = os.path.join(
+    os.path.expanduser("~"), ".cache", "apartment-finder", "driver_path")
+
+
+def resolve_chromedriver_path():
+    """Find chromedriver without a network version check when possible.
+
+    ChromeDriverManager().install() phones home on every call, which adds
+    0.5-2s of cold start. Honor CHROMEDRIVER_PATH first, then a cached
+    path from a previous run, and only fall back to the manager.
+    """
+    global _chromedriver_path
+    with _chromedriver_lock:
+        if _chromedriver_path is not None:
+            return _chromedriver_path
+
+        path = os.environ.get("CHROMEDRIVER_PATH")
+        if path and os.path.exists(path):
+            _chromedriver_path = path
+            return path
+
+        try:
+            with open(_CHROMEDRIVER_CACHE_FILE) as f:
+                cached = f.read().strip()
+            if cached and os.path.exists(cached):
+                _chromedriver_path = cached
+                return cached
+        except OSError:
+            pass
+
+        from webdriver_manager.chrome import ChromeDriverManager
+        path = ChromeDriverManager().install()
+        try:
+            os.makedirs(os.path.dirname(_CHROMEDRIVER_CACHE_FILE), exist_ok=True)
+            with open(_CHROMEDRIVER_CACHE_FILE, "w") as f:
+                f.write(path)
+        except OSError:
+            pass
+        _chromedriver_path = path
+        return path
+
+
+def invalidate_chromedriver_cache():
+    """Forget the cached driver path so the next resolve goes to the manager.
+
+    Chrome auto-updates, and chromedriver refuses to drive a Chrome whose
+    major version it doesn't match, so a cached path eventually goes stale.
+    """
+    global _chromedriver_path
+    with _chromedriver_lock:
+        _chromedriver_path = None
+        try:
+            os.remove(_CHROMEDRIVER_CACHE_FILE)
+        except OSError:
+            pass
+
+
 def get_driver():
     """Set up headless Chrome driver."""
     options = Options()
@@ -110,6 +181,13 @@ def get_driver():
     options.add_argument("--disable-extensions")
     options.add_experimental_option("excludeSwitches", ["enable-automation"])
     options.add_experimental_option("useAutomationExtension", False)
+    # We only parse text, so skip images (most of the page weight) and
+    # notification prompts
+    options.add_experimental_option("prefs", {
+        "profile.managed_default_content_settings.images": 2,
+        "profile.default_content_setting_values.notifications": 2,
+    })
+    options.add_argument("--blink-settings=imagesEnabled=false")
     
     user_agents = [
         "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
@@ -118,12 +196,17 @@ def get_driver():
     options.add_argument(f"--user-agent={random.choice(user_agents)}")
     
     if os.environ.get("GITHUB_ACTIONS"):
-        service = Service("/usr/bin/chromedriver")
-        driver = webdriver.Chrome(service=service, options=options)
+        driver = webdriver.Chrome(service=Service("/usr/bin/chromedriver"), options=options)
     else:
-        from webdriver_manager.chrome import ChromeDriverManager
-        service = Service(ChromeDriverManager().install())
-        driver = webdriver.Chrome(service=service, options=options)
+        try:
+            driver = webdriver.Chrome(
+                service=Service(resolve_chromedriver_path()), options=options)
+        except SessionNotCreatedException:
+            # Cached driver no longer matches the installed Chrome; drop the
+            # cache and resolve a fresh one through the manager
+            invalidate_chromedriver_cache()
+            driver = webdriver.Chrome(
+                service=Service(resolve_chromedriver_path()), options=options)
     
     driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {
         "source": "Object.defineProperty(navigator, 'webdriver', {get: () => undefined});"
@@ -132,205 +215,270 @@ def get_driver():
     return driver
 
 
+# Compiled once at import; re.search with a string literal re-hashes the
+# pattern cache on every call
+_PRICE_RE = re.compile(r'[\$]?([\d,]+)')
+_LISTING_ID_RE = re.compile(r'/(\d+)(?:\?|$)')
+_LAUNDRY_RE = re.compile(
+    r'washer|dryer|w/d|laundry in[- ]unit|in-unit laundry|washing machine',
+    re.IGNORECASE)
+
+# All card-text fields in one alternation so a single finditer pass
+# replaces six separate scans; net must precede price so '$X net
+# effective' isn't consumed as a plain price
+_CARD_RE = re.compile(r"""
+    (?P<net>\$[\d,]+)\s*net\s*effective
+    |(?P<price>\$[\d,]+)
+    |(?P<beds>\d+)\s*bed
+    |(?P<studio>studio)
+    |(?P<baths>[\d.]+)\s*bath
+    |(?P<sqft>[\d,]+)\s*(?:ft²|sq\.?\s*ft|square\ feet)
+    |(?P<nofee>no\ fee)
+""", re.IGNORECASE | re.VERBOSE)
+
+
+def scan_card_text(text):
+    """Extract all recognized fields from card text in a single regex pass.
+
+    Returns a dict keyed by field name (net, price, beds, studio, baths,
+    sqft, nofee), keeping the first occurrence of each.
+    """
+    fields = {}
+    for match in _CARD_RE.finditer(text):
+        group = match.lastgroup
+        if group not in fields:
+            fields[group] = match.group(group)
+    return fields
+
+
 def parse_price(price_str):
     """Extract numeric price from string like '$4,500' or '$4500'."""
     if not price_str:
         return None
-    match = re.search(r'[\$]?([\d,]+)', price_str.replace(',', ''))
+    match = _PRICE_RE.search(price_str.replace(',', ''))
     if match:
         return int(match.group(1).replace(',', ''))
     return None
 
 
-def parse_beds_baths(text):
-    """Extract beds and baths from text like '2 beds · 1 bath'."""
-    beds = None
-    baths = None
-    
-    bed_match = re.search(r'(\d+)\s*bed', text.lower())
-    if bed_match:
-        beds = int(bed_match.group(1))
-    elif 'studio' in text.lower():
-        beds = 0
-    
-    bath_match = re.search(r'([\d.]+)\s*bath', text.lower())
-    if bath_match:
-        baths = float(bath_match.group(1))
-    
-    return beds, baths
-
-
 def check_has_laundry(text):
     """Check if listing mentions in-unit laundry."""
-    laundry_keywords = ['washer', 'dryer', 'w/d', 'laundry in unit', 'in-unit laundry', 
-                        'washing machine', 'laundry in-unit']
-    text_lower = text.lower()
-    return any(kw in text_lower for kw in laundry_keywords)
+    return _LAUNDRY_RE.search(text) is not None
 
 
 def generate_listing_id(url):
     """Generate unique ID for a listing based on URL."""
     # Extract the listing ID from URL if possible
-    match = re.search(r'/(\d+)(?:\?|$)', url)
+    match = _LISTING_ID_RE.search(url)
     if match:
         return f"se_{match.group(1)}"
-    # Fallback to hash
-    return f"se_{hashlib.md5(url.encode()).hexdigest()[:12]}"
+    # Fallback to hash; blake2b beats md5 in CPython and the 6-byte digest
+    # gives the same 12 hex chars we kept before
+    return f"se_{hashlib.blake2b(url.encode(), digest_size=6).hexdigest()}"
+
+
+# Comma-joined selector unions: one querySelectorAll resolves each
+# category instead of probing selector-by-selector
+LISTING_SELECTOR = ", ".join([
+    "[data-testid='listing-card']",
+    ".listingCard",
+    ".searchCardList--listItem",
+    "article[class*='listing']",
+    "div[class*='ListingCard']",
+    ".srp-cards article",
+])
+
+ADDRESS_SELECTOR = ", ".join([
+    "[data-testid='listing-card-address']",
+    ".listingCard-addressLabel",
+    ".address",
+    "address",
+])
+
+PRICE_SELECTOR = ", ".join([
+    "[data-testid='listing-card-price']",
+    ".listingCard-price",
+    ".price",
+    "span[class*='price']",
+])
+
+# Gathers every card's text/html/url/address/price in one script call.
+# Pulling these out element-by-element costs 5+ ChromeDriver round-trips
+# per card (elem.text, get_attribute, each find_element); doing it
+# browser-side returns everything in a single JSON payload. Cards that
+# clearly fail the price/beds criteria are dropped before they ever
+# cross the wire; ambiguous cards (no price or beds parsed) pass
+# through so filter_listings stays the source of truth.
+_EXTRACT_CARDS_JS = """
+    const [cardSelector, addressSelector, priceSelector, maxPrice, minBeds] = arguments;
+    const cards = Array.from(document.querySelectorAll(cardSelector));
+    return cards.map(card => {
+        const text = card.innerText;
+        const netMatch = text.match(/\\$([\\d,]+)\\s*net\\s*effective/i);
+        const priceMatch = text.match(/\\$([\\d,]+)/);
+        const effective = netMatch || priceMatch;
+        if (maxPrice && effective && parseInt(effective[1].replace(/,/g, '')) > maxPrice) {
+            return null;
+        }
+        const bedMatch = text.match(/(\\d+)\\s*bed/i);
+        if (minBeds && bedMatch && parseInt(bedMatch[1]) < minBeds) {
+            return null;
+        }
+        let link = card.querySelector("a[href*='/rental/'], a[href*='streeteasy.com']");
+        if (!link) {
+            for (const a of card.querySelectorAll('a')) {
+                if (a.href && a.href.includes('streeteasy.com')) { link = a; break; }
+            }
+        }
+        const addr = card.querySelector(addressSelector);
+        const price = card.querySelector(priceSelector);
+        return {
+            text: text,
+            html: card.innerHTML,
+            url: link ? link.href : null,
+            address: addr ? addr.textContent.trim() : null,
+            price: price ? price.textContent : null,
+        };
+    }).filter(card => card);
+"""
+
+
+def parse_card(card):
+    """Turn one raw card dict from the browser into a listing dict."""
+    listing = {}
+    elem_text = card['text'] or ''
+    elem_html = card['html'] or ''
+
+    if not card['url']:
+        return None
+    listing['url'] = card['url']
+    listing['id'] = generate_listing_id(listing['url'])
+
+    if card['address']:
+        listing['address'] = card['address']
+
+    fields = scan_card_text(elem_text)
+
+    if card['price']:
+        listing['price'] = parse_price(card['price'])
+
+    # Fallback: extract price from text
+    if not listing.get('price') and 'price' in fields:
+        listing['price'] = parse_price(fields['price'])
+
+    # Get beds/baths
+    if 'beds' in fields:
+        listing['beds'] = int(fields['beds'])
+    else:
+        listing['beds'] = 0 if 'studio' in fields else None
+    listing['baths'] = float(fields['baths']) if 'baths' in fields else None
+
+    # Net effective rent, if advertised
+    if 'net' in fields:
+        listing['net_price'] = parse_price(fields['net'])
+    else:
+        listing['net_price'] = listing.get('price')
+
+    listing['is_no_fee'] = 'nofee' in fields
+
+    # Check for laundry
+    listing['has_laundry'] = check_has_laundry(elem_text + '\n' + elem_html)
+
+    if 'sqft' in fields:
+        listing['sqft'] = int(fields['sqft'].replace(',', ''))
+
+    # Neighborhood from URL or text
+    url_lower = listing['url'].lower()
+    if 'crown-heights' in url_lower:
+        listing['neighborhood'] = 'Crown Heights'
+    elif 'prospect-heights' in url_lower:
+        listing['neighborhood'] = 'Prospect Heights'
+    else:
+        listing['neighborhood'] = 'Brooklyn'
+
+    listing['raw_text'] = elem_text[:500]
+
+    return listing
 
 
 def scrape_listings(driver, url):
     """Scrape apartment listings from a StreetEasy search page."""
     listings = []
-    
+
     try:
         print(f"  Fetching: {url}")
         driver.get(url)
-        time.sleep(random.uniform(3, 5))  # Random delay to seem human
-        
-        # Wait for listings to load
+
+        # Wait for the page and listings to load; polling readyState beats a
+        # fixed 3-5s sleep, which overpays on fast loads
         try:
+            WebDriverWait(driver, 15).until(
+                lambda d: d.execute_script("return document.readyState") == "complete"
+            )
             WebDriverWait(driver, 15).until(
                 EC.presence_of_element_located((By.CSS_SELECTOR, "[data-testid='listing-card'], .listingCard, .searchCardList--listItem, article"))
             )
         except TimeoutException:
             print("  Timeout waiting for listings, checking page anyway...")
-        
-        # Try multiple selectors for listing cards
-        listing_selectors = [
-            "[data-testid='listing-card']",
-            ".listingCard",
-            ".searchCardList--listItem", 
-            "article[class*='listing']",
-            "div[class*='ListingCard']",
-            ".srp-cards article",
-        ]
-        
-        listing_elements = []
-        for selector in listing_selectors:
-            elements = driver.find_elements(By.CSS_SELECTOR, selector)
-            if elements:
-                print(f"  Found {len(elements)} listings with selector: {selector}")
-                listing_elements = elements
-                break
-        
-        if not listing_elements:
+
+        time.sleep(random.uniform(0.3, 0.7))  # Small jitter to seem human
+
+        cards = driver.execute_script(
+            _EXTRACT_CARDS_JS, LISTING_SELECTOR, ADDRESS_SELECTOR, PRICE_SELECTOR,
+            SEARCH_CONFIG['max_price'], SEARCH_CONFIG['min_beds'])
+
+        if cards:
+            print(f"  Found {len(cards)} listings")
+        else:
             # Try to find any links that look like listings
             all_links = driver.find_elements(By.CSS_SELECTOR, "a[href*='/rental/'], a[href*='/building/']")
             print(f"  Found {len(all_links)} potential listing links")
-        
-        for elem in listing_elements:
+
+        for card in cards:
             try:
-                listing = {}
-                elem_text = elem.text
-                elem_html = elem.get_attribute('innerHTML')
-                
-                # Get URL
-                try:
-                    link = elem.find_element(By.CSS_SELECTOR, "a[href*='/rental/'], a[href*='streeteasy.com']")
-                    listing['url'] = link.get_attribute('href')
-                except NoSuchElementException:
-                    links = elem.find_elements(By.TAG_NAME, 'a')
-                    for link in links:
-                        href = link.get_attribute('href')
-                        if href and 'streeteasy.com' in href:
-                            listing['url'] = href
-                            break
-                
-                if not listing.get('url'):
-                    continue
-                
-                listing['id'] = generate_listing_id(listing['url'])
-                
-                # Get address
-                address_selectors = [
-                    "[data-testid='listing-card-address']",
-                    ".listingCard-addressLabel",
-                    ".address",
-                    "address",
-                ]
-                for sel in address_selectors:
-                    try:
-                        addr_elem = elem.find_element(By.CSS_SELECTOR, sel)
-                        listing['address'] = addr_elem.text.strip()
-                        break
-                    except NoSuchElementException:
-                        continue
-                
-                # Get price
-                price_selectors = [
-                    "[data-testid='listing-card-price']",
-                    ".listingCard-price",
-                    ".price",
-                    "span[class*='price']",
-                ]
-                for sel in price_selectors:
-                    try:
-                        price_elem = elem.find_element(By.CSS_SELECTOR, sel)
-                        listing['price'] = parse_price(price_elem.text)
-                        break
-                    except NoSuchElementException:
-                        continue
-                
-                # Fallback: extract price from text
-                if not listing.get('price'):
-                    price_match = re.search(r'\$[\d,]+', elem_text)
-                    if price_match:
-                        listing['price'] = parse_price(price_match.group())
-                
-                # Get beds/baths
-                beds, baths = parse_beds_baths(elem_text)
-                listing['beds'] = beds
-                listing['baths'] = baths
-                
-                # Check for net effective rent
-                net_match = re.search(r'\$([\d,]+)\s*net\s*effective', elem_text.lower())
-                if net_match:
-                    listing['net_price'] = parse_price(net_match.group(1))
-                else:
-                    listing['net_price'] = listing.get('price')
-                
-                # Check for no-fee
-                listing['is_no_fee'] = 'no fee' in elem_text.lower()
-                
-                # Check for laundry
-                listing['has_laundry'] = check_has_laundry(elem_text) or check_has_laundry(elem_html)
-                
-                # Get sqft if available
-                sqft_match = re.search(r'([\d,]+)\s*(?:ft²|sq\.?\s*ft|square feet)', elem_text.lower())
-                if sqft_match:
-                    listing['sqft'] = int(sqft_match.group(1).replace(',', ''))
-                
-                # Neighborhood from URL or text
-                if 'crown-heights' in listing['url'].lower():
-                    listing['neighborhood'] = 'Crown Heights'
-                elif 'prospect-heights' in listing['url'].lower():
-                    listing['neighborhood'] = 'Prospect Heights'
-                else:
-                    listing['neighborhood'] = 'Brooklyn'
-                
-                listing['raw_text'] = elem_text[:500]
-                
-                listings.append(listing)
-                
+                listing = parse_card(card)
+                if listing:
+                    listings.append(listing)
             except Exception as e:
                 print(f"  Error parsing listing: {e}")
                 continue
-        
-        # Save debug info
-        screenshot_path = f"debug_screenshot_{int(time.time())}.png"
-        driver.save_screenshot(screenshot_path)
-        print(f"  Screenshot saved: {screenshot_path}")
-        
+
+        # Save debug info; PNG encoding at 1920x1080 costs a few hundred ms
+        # per page, so only do it when asked
+        if os.environ.get("DEBUG_SCREENSHOTS"):
+            screenshot_path = f"debug_screenshot_{int(time.time())}.png"
+            driver.save_screenshot(screenshot_path)
+            print(f"  Screenshot saved: {screenshot_path}")
+
     except Exception as e:
         print(f"  Error scraping {url}: {e}")
-    
+
     return listings
 
 
+def scrape_url_with_driver(url):
+    """Scrape one URL with a dedicated driver (one per worker thread)."""
+    driver = get_driver()
+    try:
+        return scrape_listings(driver, url)
+    finally:
+        driver.quit()
+
+
+def haversine_miles(lat1, lon1, lat2, lon2):
+    """Great-circle distance in miles between two lat/lon points."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 3958.8 * 2 * math.asin(math.sqrt(a))
+
+
 def filter_listings(listings, config):
     """Filter listings based on search criteria."""
     filtered = []
-    
+    # ~20 NYC blocks to the mile, per the 10 blocks = 0.5 miles note above
+    max_miles = TARGET_LOCATION['max_distance_blocks'] * 0.05
+
     for listing in listings:
         # Check price (use net price if available)
         price = listing.get('net_price') or listing.get('price')
@@ -349,7 +497,14 @@ def filter_listings(listings, config):
         baths = listing.get('baths')
         if baths is not None and baths < config['min_baths']:
             continue
-        
+
+        # Check distance to target station when coordinates are known
+        lat, lon = listing.get('lat'), listing.get('lon')
+        if lat is not None and lon is not None:
+            distance = haversine_miles(lat, lon, TARGET_LOCATION['lat'], TARGET_LOCATION['lon'])
+            if distance > max_miles:
+                continue
+
         filtered.append(listing)
     
     return filtered
@@ -358,76 +513,137 @@ def filter_listings(listings, config):
 def get_new_listings(conn, listings):
     """Find listings we haven't seen before."""
     cursor = conn.cursor()
-    new_listings = []
-    
-    for listing in listings:
-        cursor.execute("SELECT id FROM listings WHERE id = ?", (listing['id'],))
-        if not cursor.fetchone():
-            new_listings.append(listing)
-    
-    return new_listings
+    ids = [listing['id'] for listing in listings]
+
+    # One IN-list query instead of one SELECT per listing; chunk to stay
+    # under SQLite's bound-variable limit
+    existing = set()
+    for i in range(0, len(ids), 500):
+        chunk = ids[i:i + 500]
+        placeholders = ','.join('?' * len(chunk))
+        cursor.execute(f"SELECT id FROM listings WHERE id IN ({placeholders})", chunk)
+        existing.update(row[0] for row in cursor.fetchall())
+
+    return [listing for listing in listings if listing['id'] not in existing]
 
 
 def save_listings(conn, listings):
     """Save listings to database."""
     cursor = conn.cursor()
     now = datetime.now(timezone.utc).isoformat()
-    
-    for listing in listings:
-        cursor.execute("""
-            INSERT INTO listings (id, first_seen, last_seen, address, neighborhood, 
-                                  price, net_price, beds, baths, sqft, url, 
-                                  has_laundry, is_no_fee, raw_data)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ON CONFLICT(id) DO UPDATE SET last_seen = ?, price = ?, net_price = ?
-        """, (
-            listing['id'], now, now,
-            listing.get('address'), listing.get('neighborhood'),
-            listing.get('price'), listing.get('net_price'),
-            listing.get('beds'), listing.get('baths'), listing.get('sqft'),
-            listing.get('url'), listing.get('has_laundry', False),
-            listing.get('is_no_fee', False), listing.get('raw_text', ''),
-            now, listing.get('price'), listing.get('net_price')
-        ))
-    
+
+    # Named bindings: sqlite3 requires every placeholder key present, so
+    # normalize optional fields (address/sqft may be missing) up front
+    rows = [{
+        'id': listing['id'],
+        'first_seen': now,
+        'last_seen': now,
+        'address': listing.get('address'),
+        'neighborhood': listing.get('neighborhood'),
+        'price': listing.get('price'),
+        'net_price': listing.get('net_price'),
+        'beds': listing.get('beds'),
+        'baths': listing.get('baths'),
+        'sqft': listing.get('sqft'),
+        'url': listing.get('url'),
+        'has_laundry': listing.get('has_laundry', False),
+        'is_no_fee': listing.get('is_no_fee', False),
+        'raw_data': listing.get('raw_text', ''),
+    } for listing in listings]
+
+    cursor.executemany("""
+        INSERT INTO listings (id, first_seen, last_seen, address, neighborhood,
+                              price, net_price, beds, baths, sqft, url,
+                              has_laundry, is_no_fee, raw_data)
+        VALUES (:id, :first_seen, :last_seen, :address, :neighborhood,
+                :price, :net_price, :beds, :baths, :sqft, :url,
+                :has_laundry, :is_no_fee, :raw_data)
+        ON CONFLICT(id) DO UPDATE SET last_seen = excluded.last_seen,
+                                      price = excluded.price,
+                                      net_price = excluded.net_price
+    """, rows)
+
     conn.commit()
 
 
-def format_listing_html(listing):
-    """Format a single listing as HTML for email."""
-    price_display = f"${listing.get('price', 'N/A'):,}" if listing.get('price') else "Price N/A"
-    net_display = ""
-    if listing.get('net_price') and listing.get('net_price') != listing.get('price'):
-        net_display = f" <span style='color: #2e7d32;'>(${listing['net_price']:,} net)</span>"
-    
-    beds = listing.get('beds', '?')
-    baths = listing.get('baths', '?')
-    
-    badges = []
-    if listing.get('has_laundry'):
-        badges.append("🧺 Laundry")
-    if listing.get('is_no_fee'):
-        badges.append("✨ No Fee")
-    
-    badge_html = " ".join([f"<span style='background:#e3f2fd;padding:2px 8px;border-radius:4px;font-size:12px;margin-right:5px;'>{b}</span>" for b in badges])
-    
-    return f"""
+# Bound .format method: the template is parsed once at import instead of
+# per listing
+_LISTING_TPL = """
     <div style="border: 1px solid #ddd; border-radius: 8px; padding: 15px; margin: 10px 0; background: #fafafa;">
         <div style="font-size: 18px; font-weight: bold; color: #1a237e;">
             {price_display}{net_display}
         </div>
         <div style="font-size: 14px; color: #666; margin: 5px 0;">
-            {beds} bed · {baths} bath · {listing.get('neighborhood', 'Brooklyn')}
+            {beds} bed · {baths} bath · {neighborhood}
         </div>
         <div style="font-size: 14px; margin: 5px 0;">
-            📍 {listing.get('address', 'Address not available')}
+            📍 {address}
         </div>
         <div style="margin: 10px 0;">{badge_html}</div>
-        <a href="{listing.get('url', '#')}" style="display: inline-block; background: #1a237e; color: white; padding: 8px 16px; text-decoration: none; border-radius: 4px; font-size: 14px;">
+        <a href="{url}" style="display: inline-block; background: #1a237e; color: white; padding: 8px 16px; text-decoration: none; border-radius: 4px; font-size: 14px;">
             View Listing →
         </a>
     </div>
-    """
+    """.format
+
+
+def format_listing_html(listing):
+    """Format a single listing as HTML for email, escaping scraped fields."""
+    price_display = f"${listing.get('price', 'N/A'):,}" if listing.get('price') else "Price N/A"
+    net_display = ""
+    if listing.get('net_price') and listing.get('net_price') != listing.get('price'):
+        net_display = f" <span style='color: #2e7d32;'>(${listing['net_price']:,} net)</span>"
+
+    badges = []
+    if listing.get('has_laundry'):
+        badges.append("🧺 Laundry")
+    if listing.get('is_no_fee'):
+        badges.append("✨ No Fee")
+
+    badge_html = " ".join([f"<span style='background:#e3f2fd;padding:2px 8px;border-radius:4px;font-size:12px;margin-right:5px;'>{b}</span>" for b in badges])
+
+    return _LISTING_TPL(
+        price_display=price_display,
+        net_display=net_display,
+        beds=html.escape(str(listing.get('beds', '?'))),
+        baths=html.escape(str(listing.get('baths', '?'))),
+        neighborhood=html.escape(str(listing.get('neighborhood', 'Brooklyn'))),
+        address=html.escape(str(listing.get('address', 'Address not available'))),
+        badge_html=badge_html,
+        url=html.escape(listing.get('url', '#'), quote=True),
+    )
+
+
+# Cached SMTP connection: the Gmail TLS handshake costs ~500ms, so reuse
+# the socket when alerts are sent more than once per process
+_smtp_client = None
+
+
+def get_smtp_client():
+    """Return a logged-in SMTP_SSL client, reconnecting if the socket died."""
+    global _smtp_client
+    if _smtp_client is not None:
+        try:
+            _smtp_client.noop()
+            return _smtp_client
+        except (smtplib.SMTPException, OSError):
+            _smtp_client = None
+
+    client = smtplib.SMTP_SSL("smtp.gmail.com", 465)
+    client.login(EMAIL_SENDER, EMAIL_PASSWORD)
+    _smtp_client = client
+    return client
+
+
+def reset_smtp_client():
+    """Drop the cached SMTP connection so the next send reconnects."""
+    global _smtp_client
+    if _smtp_client is not None:
+        try:
+            _smtp_client.close()
+        except Exception:
+            pass
+        _smtp_client = None
 
 
 def send_email_alert(new_listings, all_count):
@@ -493,11 +709,14 @@ def send_email_alert(new_listings, all_count):
         msg["To"] = EMAIL_RECIPIENT
         msg["Subject"] = subject
         msg.attach(MIMEText(body, "html"))
-        
-        with smtplib.SMTP_SSL("smtp.gmail.com", 465) as server:
-            server.login(EMAIL_SENDER, EMAIL_PASSWORD)
-            server.sendmail(EMAIL_SENDER, EMAIL_RECIPIENT, msg.as_string())
-        
+
+        try:
+            get_smtp_client().send_message(msg)
+        except (smtplib.SMTPException, OSError):
+            # Connection may have gone stale since the last send; retry fresh
+            reset_smtp_client()
+            get_smtp_client().send_message(msg)
+
         print(f"✅ Email sent: {subject}")
         return True
     except Exception as e:
@@ -517,26 +736,25 @@ def main():
     print()
     
     conn = init_db()
-    driver = get_driver()
-    
-    all_listings = []
-    
+
+    total_scraped = 0
+    seen_ids = set()
+    unique_listings = []
+
     try:
-        for url in BASE_URLS:
-            listings = scrape_listings(driver, url)
-            all_listings.extend(listings)
-            time.sleep(random.uniform(2, 4))  # Be nice to the server
-        
-        print(f"\n📊 Total listings scraped: {len(all_listings)}")
-        
-        # Remove duplicates by ID
-        seen_ids = set()
-        unique_listings = []
-        for listing in all_listings:
-            if listing['id'] not in seen_ids:
-                seen_ids.add(listing['id'])
-                unique_listings.append(listing)
-        
+        # Each URL is independent and network-bound, so scrape them in
+        # parallel with one browser per worker; wall time becomes the
+        # slowest page instead of the sum. Deduplicate by ID as results
+        # come in.
+        with ThreadPoolExecutor(max_workers=len(BASE_URLS)) as executor:
+            for listings in executor.map(scrape_url_with_driver, BASE_URLS):
+                total_scraped += len(listings)
+                for listing in listings:
+                    if listing['id'] not in seen_ids:
+                        seen_ids.add(listing['id'])
+                        unique_listings.append(listing)
+
+        print(f"\n📊 Total listings scraped: {total_scraped}")
         print(f"📊 Unique listings: {len(unique_listings)}")
         
         # Filter by criteria
@@ -557,13 +775,12 @@ def main():
         
         # Send alert for new listings
         if new_listings:
-            send_email_alert(new_listings, len(all_listings))
+            send_email_alert(new_listings, total_scraped)
         else:
             print("\n✨ No new listings since last check")
             # Optionally send a "still searching" email once a week
         
     finally:
-        driver.quit()
         conn.close()
     
     print("\n" + "=" * 60)